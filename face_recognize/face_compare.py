@@ -1,7 +1,16 @@
 import math
+import numpy as np
 from utils.img_load import read_bgr
 from deepface import DeepFace
 
+MODEL_NAME = "ArcFace"
+DETECTORS = ("retinaface", "opencv")
+# DeepFace's verification threshold for ArcFace + cosine distance
+COSINE_THRESHOLD = 0.68
+
+# Set by enable_gpu_fp16, so process-pool workers can apply the same policy
+_FP16_ENABLED = False
+
 
 def sigmoid_similarity(distance: float, threshold: float, k_factor: float = 8.0) -> float:
     if threshold <= 0:
@@ -20,12 +29,12 @@ def compare_faces(src_path: str, tst_path: str) -> dict:
     src_img = read_bgr(src_path)
     tst_img = read_bgr(tst_path)
 
-    for det in ("retinaface", "opencv"):
+    for det in DETECTORS:
         try:
             res = DeepFace.verify(
                 img1_path=src_img,
                 img2_path=tst_img,
-                model_name="ArcFace",
+                model_name=MODEL_NAME,
                 distance_metric="cosine",
                 detector_backend=det,
                 align=True,
@@ -38,7 +47,7 @@ def compare_faces(src_path: str, tst_path: str) -> dict:
                 "threshold": thr,
                 "sigmoid": sigmoid_similarity(dist, thr),
                 "verified": bool(res.get("verified", dist <= thr)),
-                "model": "ArcFace",
+                "model": MODEL_NAME,
                 "detector": det
             }
         except Exception:
@@ -47,6 +56,121 @@ def compare_faces(src_path: str, tst_path: str) -> dict:
     raise RuntimeError("verification failed with all detectors")
 
 
+def enable_gpu_fp16() -> bool:
+    """
+    Run ArcFace inference on the GPU with float16 mixed precision.
+    Call once before the first embedding: DeepFace builds and caches the
+    model per process, so the dtype policy must be set before that.
+    Returns False (and leaves float32 in place) when no GPU is visible or
+    the built model did not pick up the mixed_float16 policy.
+    """
+    import tensorflow as tf
+
+    gpus = tf.config.list_physical_devices("GPU")
+    if not gpus:
+        return False
+    for gpu in gpus:
+        try:
+            tf.config.experimental.set_memory_growth(gpu, True)
+        except RuntimeError:
+            pass  # GPU already initialized
+    # Same Keras namespace DeepFace builds ArcFace with
+    tf.keras.mixed_precision.set_global_policy("mixed_float16")
+    model = DeepFace.build_model(MODEL_NAME)  # build the cached model under the fp16 policy
+
+    # Newer DeepFace wraps the Keras model in a client object
+    keras_model = getattr(model, "model", model)
+    policy = getattr(keras_model, "dtype_policy", None)
+    if getattr(policy, "name", policy) != "mixed_float16":
+        tf.keras.mixed_precision.set_global_policy("float32")
+        return False
+
+    global _FP16_ENABLED
+    _FP16_ENABLED = True
+    return True
+
+
+def fp16_enabled() -> bool:
+    """True once enable_gpu_fp16 succeeded in this process."""
+    return _FP16_ENABLED
+
+
+def embed_face(path: str) -> tuple[np.ndarray, str]:
+    """
+    Detect + align the face in one image and return its ArcFace embedding
+    (L2-normalized float32, also under fp16 inference) with the detector that succeeded.
+    """
+    img = read_bgr(path)
+    for det in DETECTORS:
+        try:
+            reps = DeepFace.represent(
+                img_path=img,
+                model_name=MODEL_NAME,
+                detector_backend=det,
+                align=True,
+                enforce_detection=True
+            )
+            emb = np.asarray(reps[0]["embedding"], dtype=np.float32)
+            return emb / max(float(np.linalg.norm(emb)), 1e-12), det
+        except Exception:
+            print(f"[{det}] DeepFace.represent failed: Image is not a person")
+            continue
+    raise RuntimeError("embedding failed with all detectors")
+
+
+def metrics_from_similarity(sim: float, detector: str, emb: np.ndarray | None = None) -> dict:
+    """
+    Build the compare_faces-style metrics dict from a cosine similarity.
+    When the candidate embedding is given it is kept under 'emb' (np.ndarray).
+    """
+    dist = float(1.0 - sim)
+    fm = {
+        "distance": dist,
+        "threshold": COSINE_THRESHOLD,
+        "sigmoid": sigmoid_similarity(dist, COSINE_THRESHOLD),
+        "verified": dist <= COSINE_THRESHOLD,
+        "model": MODEL_NAME,
+        "detector": detector
+    }
+    if emb is not None:
+        fm["emb"] = emb
+    return fm
+
+
+def compare_faces_batch(src_path: str, cand_paths: list[str], *,
+                        src_emb: np.ndarray | None = None) -> list[dict | None]:
+    """
+    Compare one source image against many candidates. The source is embedded
+    once (or taken from src_emb when already known), candidate embeddings are
+    stacked and scored with a single matmul.
+    Returns one metrics dict per candidate (same shape as compare_faces),
+    or None where no face could be embedded.
+    """
+    if not cand_paths:
+        return []
+    if src_emb is None:
+        src_emb, _ = embed_face(src_path)
+
+    embs, dets, ok = [], [], []
+    for i, path in enumerate(cand_paths):
+        try:
+            emb, det = embed_face(path)
+        except Exception:
+            continue
+        embs.append(emb)
+        dets.append(det)
+        ok.append(i)
+
+    results: list[dict | None] = [None] * len(cand_paths)
+    if not ok:
+        return results
+
+    sims = np.stack(embs) @ src_emb
+    for i, det, sim, emb in zip(ok, dets, sims, embs):
+        results[i] = metrics_from_similarity(sim, det, emb)
+    return results
+
+
 def cli():
     import argparse
     ap = argparse.ArgumentParser(description="Compare two images with DeepFace ArcFace")
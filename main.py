@@ -8,8 +8,9 @@ from utils.make_persons_jsons import run_make_person_jsons
 from scraper.login_headless import login
 from scraper.scrape_links import scrape_into_json
 from scraper.scrape_profile_photos_simple import download_photos
-from scraper.scrape_from_GImages import scrape_linkedin_images_into_json as scrape_from_gimages
-from matcher import run_matcher
+from scraper.scrape_from_GImages import scrape_many
+from matcher import run_matcher, make_embedding_pool
+from face_recognize.face_compare import enable_gpu_fp16
 
 
 
@@ -36,6 +37,11 @@ def main():
     ap.add_argument("--gimages-limit", type=int, default=10,
                     help="Max profiles to collect per person when using Google Images (default).")
 
+    ap.add_argument("--face-workers", type=int, default=1,
+                    help="Processes used to embed candidate faces (0 = all cores).")
+    ap.add_argument("--face-fp16", action="store_true",
+                    help="Run face embedding on the GPU in float16 (mixed precision).")
+
     ap.add_argument("--output", default="output.json")
     args = ap.parse_args()
 
@@ -45,11 +51,16 @@ def main():
     output_path = Path(args.output).resolve()
     persons_dir.mkdir(parents=True, exist_ok=True)
 
+    if args.face_fp16 and not enable_gpu_fp16():
+        print("No GPU found, face embedding runs in float32.")
+
     # 1) make per-person JSONs
     run_make_person_jsons(src_dir, persons_dir)
 
     # 2) process each person JSON (choose pipeline)
     summaries: List[Dict[str, Any]] = []
+    # One embedding pool (None = in-process) reused for every person
+    pool = make_embedding_pool(args.face_workers)
 
     if args.full_pictures:
         # Ensure login state only for the full-pictures flow
@@ -74,7 +85,7 @@ def main():
                 headless=args.headless,
                 delay=args.photos_delay,
             )
-            summary = run_matcher(person_json)
+            summary = run_matcher(person_json, pool=pool)
             summaries.append({
                 "name": summary["name"],
                 "linkedin_url": summary["linkedin_url"],
@@ -83,15 +94,20 @@ def main():
             })
     else:
         # Default flow: Google Images → base64 thumbnails + profile links
-        for person_json in sorted(persons_dir.glob("*.json")):
-            print(f"\n--- Processing {person_json.name}")
-            n = scrape_from_gimages(
-                person_json,
-                headless=args.headless,
-                limit=args.gimages_limit,
-            )
-            print(f"Collected {n} candidates from Google Images.")
-            summary = run_matcher(person_json)
+        person_jsons = sorted(persons_dir.glob("*.json"))
+        # One browser for all persons, a fresh page per person; closed before matching
+        counts = scrape_many(
+            person_jsons,
+            headless=args.headless,
+            limit=args.gimages_limit,
+            storage_state=str(state_file),
+        )
+        for person_json in person_jsons:
+            print(f"{person_json.name}: collected {counts[str(person_json)]} candidates from Google Images.")
+
+        for person_json in person_jsons:
+            print(f"\n--- Matching {person_json.name}")
+            summary = run_matcher(person_json, pool=pool)
             summaries.append({
                 "name": summary["name"],
                 "linkedin_url": summary["linkedin_url"],
@@ -99,6 +115,9 @@ def main():
                 "match_status": summary.get("match_status"),
             })
 
+    if pool is not None:
+        pool.shutdown()
+
     # 3) aggregated output
     output_path.write_text(json.dumps(summaries, ensure_ascii=False, indent=2), encoding="utf-8")
     print(f"\nWrote {output_path}.")
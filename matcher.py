@@ -1,61 +1,181 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+import numpy as np
+
 from utils.json_store import (
     load_person,
-    set_candidate_face,
-    select_best_candidate,
-    candidate_has_face,
+    save_person,
+    set_source_embedding,
+    get_source_embedding,
+    encode_embedding,
+    select_best_candidate_by_embedding,
     NO_IMAGE_TOKEN,
 )
-from face_recognize.face_compare import compare_faces
-from utils.name_match import is_exact_name, name_similarity
+from face_recognize.face_compare import (
+    compare_faces_batch,
+    embed_face,
+    metrics_from_similarity,
+    enable_gpu_fp16,
+    fp16_enabled,
+)
+from utils.name_match import normalize_name, similarity_normalized, name_similarities
 
 FUZZY_MIN = 92
+# A lone exact-name candidate above this sigmoid is accepted without embedding the others
+SHORT_CIRCUIT_SIG = 0.6
+
+# (path, mtime) -> L2-normalized source embedding, shared across calls in this process
+_SRC_EMB_CACHE: dict[tuple[str, float], np.ndarray] = {}
 
 
 # Face metrics computation
 
-def compute_missing_face_metrics(person_json: Path | str, src_image: str) -> None:
+def _get_src_embedding(src_image: str, data: Dict[str, Any]) -> np.ndarray:
     """
-    For each candidate without face metrics, run compare_faces(src_image, cand_img)
-    and persist the 'face' field. Skips candidates with NO_IMAGE_TOKEN.
+    Source embedding lookup: in-memory cache, then the copy persisted in the
+    person dict, and only then a fresh forward pass (stored back into `data`).
     """
-    p = Path(person_json)
-    data = load_person(p)
-    candidates = data.get("candidates") or []
+    mtime = os.stat(src_image).st_mtime
+    key = (src_image, mtime)
+    emb = _SRC_EMB_CACHE.get(key)
+    if emb is not None:
+        return emb
+
+    emb = get_source_embedding(data, src_image, mtime)
+    if emb is None:
+        emb, _ = embed_face(src_image)
+        set_source_embedding(data, src_image, mtime, emb)
+    _SRC_EMB_CACHE[key] = emb
+    return emb
+
+
+def _init_worker(fp16: bool) -> None:
+    if fp16:
+        enable_gpu_fp16()
+
+
+def _cmp(url: str, cand_img: str, src_emb: np.ndarray) -> tuple[str, Optional[Dict[str, Any]]]:
+    """Pool worker: embed one candidate and score it against the source embedding."""
+    try:
+        emb, det = embed_face(cand_img)
+    except Exception:
+        return url, None
+    return url, metrics_from_similarity(float(emb @ src_emb), det, emb)
+
+
+def make_embedding_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Create the candidate-embedding process pool once, to be reused across persons
+    (each worker loads TensorFlow and ArcFace only once). Returns None when
+    workers resolves to 1 (0 = all cores): embedding then stays in-process.
+    Workers are spawned, not forked: the parent has already initialized
+    TensorFlow (and possibly CUDA), neither of which survives a fork.
+    Call after enable_gpu_fp16 so workers get the same dtype policy.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers,
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker,
+                               initargs=(fp16_enabled(),))
+
+
+def _compare_in_pool(pool: ProcessPoolExecutor, src_emb: np.ndarray,
+                     pending: list[tuple[str, str]]) -> list[Optional[Dict[str, Any]]]:
+    """
+    Embed candidates on the pool; results follow `pending` order.
+    Pool failures (e.g. BrokenProcessPool) propagate to the caller.
+    """
+    by_url: Dict[str, Optional[Dict[str, Any]]] = {}
+    futures = [pool.submit(_cmp, url, img, src_emb) for url, img in pending]
+    for fut in as_completed(futures):
+        url, fm = fut.result()
+        by_url[url] = fm
+    return [by_url.get(url) for url, _ in pending]
+
+
+def compute_missing_face_metrics(data: Dict[str, Any], src_image: str,
+                                 pool: Optional[ProcessPoolExecutor] = None,
+                                 candidates: Optional[list[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    For candidates without face metrics, run one compare_faces_batch(src_image, cand_imgs)
+    and store each 'face' field in `data` (mutated in place and returned; the caller saves).
+    Skips candidates with NO_IMAGE_TOKEN.
+    With a pool (see make_embedding_pool), candidates are embedded there instead.
+    :param candidates: restrict to these candidate dicts (default: all of data['candidates']).
+    """
+    if candidates is None:
+        candidates = data.get("candidates") or []
 
+    pending = []
     for c in candidates:
         # Skip explicit "no image"
         if (c.get("photo_path") or "").strip() == NO_IMAGE_TOKEN:
             continue
 
         cand_img = c.get("photo_path") or c.get("image_file")
-        url = c.get("profile_url")
-        if not (cand_img and url):
+        if not (cand_img and c.get("profile_url")):
             continue
 
         # Do not recompute if metrics already exist
-        if candidate_has_face(p, url):
+        if c.get("face"):
+            continue
+        pending.append((c, cand_img))
+
+    if not pending:
+        return data
+
+    try:
+        src_emb = _get_src_embedding(src_image, data)
+    except Exception:
+        src_emb = None
+
+    if src_emb is None:
+        # Source face could not be embedded: nothing is comparable
+        results = [None] * len(pending)
+    else:
+        # Per-candidate failures come back as None; pool errors are not "no face"
+        # results and must not be saved as such, so they propagate.
+        if pool is not None and len(pending) > 1:
+            jobs = [(c["profile_url"], img) for c, img in pending]
+            results = _compare_in_pool(pool, src_emb, jobs)
+        else:
+            results = compare_faces_batch(src_image, [img for _, img in pending], src_emb=src_emb)
+
+    for (c, cand_img), fm in zip(pending, results):
+        if fm is None:
+            c["face"] = {"error": "no_face_metrics"}
             continue
+        c["face"] = dict(fm)
+        if fm.get("emb") is not None:
+            # Stored as base64 float32 for select_best_candidate_by_embedding
+            c["face"]["emb"] = encode_embedding(fm["emb"])
+        print(f"Compared to {cand_img}, score is {fm.get('sigmoid')}")
 
-        try:
-            fm = compare_faces(src_image, cand_img)
-            set_candidate_face(p, url, fm)
-            print(f"Compared to {cand_img}, score is {fm.get('sigmoid')}")
-        except Exception:
-            set_candidate_face(p, url, {"error": "no_face_metrics"})
+    return data
 
 
 # Best candidate selection
 
-def pick_best_candidate(person_json: Path | str) -> Optional[Dict[str, Any]]:
+def pick_best_candidate_from_data(data: Dict[str, Any],
+                                  name_scores: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
     """
-    Reloads JSON (after face metrics were potentially written) and returns
-    the candidate dict with the highest face['sigmoid'], or None.
+    Returns the candidate dict with the highest face['sigmoid'], or None.
+    Sigmoid ties are broken by name_scores (profile_url -> name similarity).
+    Uses the stored embeddings (one matmul) when every scored candidate has one.
     """
-    data = load_person(person_json)
-    return select_best_candidate(data)
+    return select_best_candidate_by_embedding(data, name_scores)
+
+
+def pick_best_candidate(person_json: Path | str,
+                        name_scores: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    """Same as pick_best_candidate_from_data, reading the person JSON from disk."""
+    return pick_best_candidate_from_data(load_person(person_json), name_scores)
 
 
 # Name classification
@@ -64,18 +184,27 @@ def classify_name_status(query_name: str, best_name: str, fuzzy_min: int = FUZZY
     """
     Returns: 'matched' | 'Probable Match (Fuzzy Name)' | 'no_match'
     """
-    if is_exact_name(query_name, best_name):
+    qn, bn = normalize_name(query_name), normalize_name(best_name)
+    if qn == bn:
         return "matched"
-    sim = name_similarity(query_name, best_name) or 0
+    # token_sort_ratio can't exceed 200*short/(short+long): skip it when that is already too low
+    short, long_ = sorted((len(qn), len(bn)))
+    if 200 * short / max(short + long_, 1) < fuzzy_min:
+        return "no_match"
+    sim = similarity_normalized(qn, bn, score_cutoff=fuzzy_min) or 0
     return "Probable Match (Fuzzy Name)" if sim >= fuzzy_min else "no_match"
 
 
 # Orchestrator
 
-def run_matcher(person_json: str | Path) -> Dict[str, Any]:
+def run_matcher(person_json: str | Path, pool: Optional[ProcessPoolExecutor] = None,
+                short_circuit_sig: Optional[float] = SHORT_CIRCUIT_SIG) -> Dict[str, Any]:
     """
     Compares the first source image to all candidates, picks the best by face,
     then applies name matching to set the final status.
+    If exactly one candidate has the exact query name, it is embedded first and
+    accepted right away when its sigmoid exceeds short_circuit_sig (None disables).
+    :param pool: shared embedding pool from make_embedding_pool (None = in-process).
     """
     p = Path(person_json)
     data = load_person(p)
@@ -91,12 +220,32 @@ def run_matcher(person_json: str | Path) -> Dict[str, Any]:
         }
 
     src = src_images[0]
+    qname = data.get("query_name") or ""
 
-    # 1) compute missing face metrics and persist
-    compute_missing_face_metrics(p, src)
+    # 0) a single exact-name candidate with a good face score wins without embedding the rest
+    if short_circuit_sig is not None:
+        qnorm = normalize_name(qname)
+        exact = [c for c in cands if normalize_name(c.get("name") or "") == qnorm]
+        if len(exact) == 1:
+            compute_missing_face_metrics(data, src, candidates=exact)
+            sig = float((exact[0].get("face") or {}).get("sigmoid") or 0.0)
+            if sig > short_circuit_sig:
+                save_person(p, data)
+                return {
+                    "name": qname,
+                    "linkedin_url": exact[0].get("profile_url"),
+                    "image_similarity": round(sig, 4),
+                    "match_status": "matched",
+                }
 
-    # 2) pick overall best by sigmoid
-    best = pick_best_candidate(p)
+    # 1) compute missing face metrics and persist (single write)
+    compute_missing_face_metrics(data, src, pool=pool)
+    save_person(p, data)
+
+    # 2) pick overall best by sigmoid, name similarity breaks ties
+    scores = name_similarities(qname, [c.get("name") or "" for c in cands])
+    name_scores = {c.get("profile_url"): sc for c, sc in zip(cands, scores)}
+    best = pick_best_candidate_from_data(data, name_scores)
     if not best:
         return {
             "name": data.get("query_name"),
@@ -105,7 +254,6 @@ def run_matcher(person_json: str | Path) -> Dict[str, Any]:
             "match_status": "no_match",
         }
 
-    qname = data.get("query_name") or ""
     bname = best.get("name") or ""
     sig = float((best.get("face") or {}).get("sigmoid") or 0.0)
 
@@ -125,8 +273,17 @@ def _cli():
     import argparse
     ap = argparse.ArgumentParser(description="Run matcher on one person JSON")
     ap.add_argument("json_path")
+    ap.add_argument("--workers", type=int, default=1, help="Embedding processes (0 = all cores)")
+    ap.add_argument("--fp16", action="store_true", help="GPU float16 inference for ArcFace")
     args = ap.parse_args()
-    _ = run_matcher(args.json_path)
+    if args.fp16 and not enable_gpu_fp16():
+        print("No GPU found, face embedding runs in float32.")
+    pool = make_embedding_pool(args.workers)
+    try:
+        _ = run_matcher(args.json_path, pool=pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -1,75 +1,84 @@
 import re
 import base64
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterable, Iterator
 from urllib.parse import urlparse, parse_qs, unquote
 
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+from playwright.sync_api import sync_playwright, BrowserContext, TimeoutError as PWTimeout
 from utils.json_store import (
     load_person,
-    upsert_candidate,
-    candidate_has_photo,
+    bulk_upsert_candidates,
+    index_candidates,
     NO_IMAGE_TOKEN,
 )
 
 GOOGLE_IMG = "https://www.google.com/search?udm=2&tbm=isch&hl=en&q={q}"
+STATE_FILE_DEFAULT = "login_state.json"
+
+# Requests aborted by the session route: the scan only needs the HTML,
+# its scripts/XHRs and the base64 thumbnails already inlined in the page
+_BLOCKED_RESOURCE_TYPES = {"font", "stylesheet", "media"}
+_BLOCKED_URL_PARTS = ("doubleclick", "googlesyndication", "google-analytics", "googletagmanager")
+
+_DATA_URL_FULL = re.compile(r"^data:(image/[^;]+);base64,(.+)$", re.I | re.S)
+_SLUG = re.compile(r"[^a-z0-9]+")
+_TITLE_SPLIT = re.compile(r"\s[-–—]\s")
 
 
 
 def _slugify(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = re.sub(r"[^a-z0-9]+", "-", s)
-    return re.sub(r"-+", "-", s).strip("-") or "image"
+    return _SLUG.sub("-", (s or "").lower()).strip("-") or "image"
 
 
-def _profile_handle(url: str) -> str:
-    try:
-        parts = [x for x in urlparse(url).path.split("/") if x]
-        if len(parts) >= 2 and parts[0] == "in":
-            return parts[1]
-    except Exception:
-        pass
-    return _slugify(url)
+@dataclass(frozen=True)
+class _Profile:
+    url: str  # canonical https://www.linkedin.com/in/<handle>, or the unwrapped href
+    handle: str
+    is_linkedin_profile: bool
 
 
-def _unwrap_google_href(href: str) -> str:
-    """Unwrap /url?url=... style Google redirects to the real URL if present."""
+@lru_cache(maxsize=1024)
+def _parse_profile(href: str) -> _Profile:
+    """
+    Unwrap /url?url=... Google redirects, canonicalize to
+    https://www.linkedin.com/in/<handle> and extract the handle, parsing the
+    URL once. Cached: Google often repeats the same profile across tiles.
+    """
     try:
         p = urlparse(href)
         if p.path == "/url":
             target = (parse_qs(p.query).get("url") or [None])[0]
             if target:
-                return unquote(target)
-    except Exception:
-        pass
-    return href
-
-
-def _normalize_profile_url(u: str) -> str | None:
-    """Canonicalize to https://www.linkedin.com/in/<handle> when possible."""
-    try:
-        p = urlparse(u)
-        if "linkedin.com" not in p.netloc:
-            return None
+                href = unquote(target)
+                p = urlparse(href)
         parts = [x for x in p.path.split("/") if x]
-        if len(parts) >= 2 and parts[0] == "in":
-            return f"https://www.linkedin.com/in/{parts[1]}"
-        return f"{p.scheme}://{p.netloc}{p.path}"
+        if "linkedin.com" in p.netloc and len(parts) >= 2 and parts[0] == "in":
+            return _Profile(f"https://www.linkedin.com/in/{parts[1]}", parts[1], True)
     except Exception:
-        return None
+        pass
+    return _Profile(href, _slugify(href), False)
 
 
 def _parse_data_url(data_url: str) -> tuple[str, bytes] | None:
     if not (data_url and data_url.startswith("data:image/")):
         return None
-    m = re.match(r"^data:(image/[^;]+);base64,(.+)$", data_url, flags=re.IGNORECASE | re.DOTALL)
+    m = _DATA_URL_FULL.match(data_url)
     if not m:
         return None
     mime = m.group(1).lower()
     b64 = m.group(2)
     try:
-        raw = base64.b64decode(b64, validate=True)
-    except Exception:
+        # The regex already checked the data-URL shape; skip the slow validate scan
+        raw = base64.b64decode(b64)
+    except ValueError:  # binascii.Error, or non-ASCII characters in the payload
+        return None
+    # Without validate=True, non-alphabet characters are dropped rather than rejected
+    if not raw:
         return None
     ext = ".bin"
     if mime in ("image/jpeg", "image/jpg"):
@@ -85,90 +94,149 @@ def _title_to_name(title: str | None) -> str:
     title = (title or "").strip()
     if not title:
         return ""
-    return re.split(r"\s[-–—]\s", title, maxsplit=1)[0].strip()
-
-
-def _is_tiny_icon(img_el) -> bool:
-    try:
-        w = img_el.get_attribute("width")
-        h = img_el.get_attribute("height")
-        w = int(w) if (w and w.isdigit()) else 0
-        h = int(h) if (h and h.isdigit()) else 0
-        return (w and w < 80) or (h and h < 80)
-    except Exception:
-        return False
-
-
-def _class_contains_xpath(cls: str) -> str:
-    # contains(concat(' ', normalize-space(@class), ' '), ' cls ')
-    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
-
-
-def _collect_by_forward_scan_python(page, max_collect: int) -> list[dict]:
+    return _TITLE_SPLIT.split(title, maxsplit=1)[0].strip()
+
+
+# Runs in the page: one pass over the base64 <img> tiles, returning plain data.
+# For each tile, walk forward in document order (XPath following::) to the
+# first <a> or <img>; an <img> means the tile is not a profile card.
+_FORWARD_SCAN_JS = r"""
+() => {
+  const out = [];
+  const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_ELEMENT);
+  for (const img of document.querySelectorAll('img[src^="data:image/"]')) {
+    const src = (img.getAttribute("src") || "").trim();
+    // Prefer real thumbs; skip the little png site icons
+    if (!/^data:image\/(jpeg|jpg|webp);base64,/i.test(src)) continue;
+    // Intrinsic size when decoded, else the rendered one; 0 means unknown
+    const w = img.naturalWidth || img.width;
+    const h = img.naturalHeight || img.height;
+    if ((w && w < 80) || (h && h < 80)) continue;
+
+    walker.currentNode = img;
+    let nxt = walker.nextNode();
+    while (nxt && nxt.tagName !== "A" && nxt.tagName !== "IMG") nxt = walker.nextNode();
+    if (!nxt || nxt.tagName !== "A") continue;
+
+    const href = (nxt.getAttribute("href") || "").trim();
+    if (!href) continue;
+    const titleEl = nxt.querySelector("div.toI8Rb.OSrXXb");
+    out.push({data_url: src, href: href, title: titleEl ? titleEl.innerText.trim() : ""});
+  }
+  return out;
+}
+"""
+
+
+def _collect_by_forward_scan(page, max_collect: int) -> list[dict]:
     """
     For each base64 <img> (jpeg/webp, not tiny):
-      - find the first following element that is <a> or <img>:
-          xpath: ./following::*[self::a or self::img][1]
+      - find the first following element that is <a> or <img>
       - if it's <img> → skip this tile
       - if it's <a> → unwrap+normalize href; must contain linkedin.com/in
-        and fetch the visible title: .//div[class has toI8Rb and OSrXXb]
-    Returns list of dicts: {data_url, href, title}
+        and fetch the visible title: div.toI8Rb.OSrXXb inside the <a>
+    The DOM walk runs in the browser in a single page.evaluate round-trip.
+    Returns list of dicts: {data_url, href, handle, title}
     """
     results = []
-    imgs = page.query_selector_all('img[src^="data:image/"]')
-    for img in imgs:
+    for card in page.evaluate(_FORWARD_SCAN_JS):
         if len(results) >= max_collect:
             break
 
-        src = (img.get_attribute("src") or "").strip()
-        if not src:
-            continue
-        # Prefer real thumbs; skip the little png site icons
-        if not re.match(r"^data:image/(jpeg|jpg|webp);base64,", src, flags=re.I):
-            continue
-        if _is_tiny_icon(img):
+        prof = _parse_profile(card.get("href") or "")
+        if not prof.is_linkedin_profile:
             continue
 
-        # First following element that is either A or IMG
-        nxt = img.query_selector('xpath=./following::*[self::a or self::img][1]')
-        if not nxt:
-            continue
+        results.append({"data_url": card.get("data_url") or "", "href": prof.url,
+                        "handle": prof.handle, "title": card.get("title") or ""})
 
-        href = (nxt.get_attribute("href") or "").strip()
-        if not href:
-            # If no href, that "nxt" is an IMG → this tile is not a profile card
-            continue
+    return results
 
-        href = _unwrap_google_href(href)
-        prof = _normalize_profile_url(href) or href
-        if "linkedin.com/in/" not in prof:
-            continue
-        prof = prof.split("?")[0].split("#")[0]
 
-        # Inside the <a>, get <div class="toI8Rb OSrXXb">…</div>
-        title_xpath = (
-            f'xpath=.//div[{_class_contains_xpath("toI8Rb")} and '
-            f'{_class_contains_xpath("OSrXXb")}]'
-        )
-        title_el = nxt.query_selector(title_xpath)
-        title = title_el.inner_text().strip() if title_el else ""
+def _process_card(data_url: str, out_stem: Path) -> str:
+    """
+    Decode one base64 thumbnail and write it next to out_stem (extension from the mime).
+    Runs on a worker thread; returns the saved path or NO_IMAGE_TOKEN.
+    """
+    parsed = _parse_data_url(data_url)
+    if not parsed:
+        return NO_IMAGE_TOKEN
+    ext, raw = parsed
+    out_path = out_stem.with_suffix(ext)
+    try:
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        out_path.write_bytes(raw)
+    except Exception:
+        return NO_IMAGE_TOKEN
+    return str(out_path)
 
-        results.append({"data_url": src, "href": prof, "title": title})
 
-    return results
+def _block_non_essential(route) -> None:
+    req = route.request
+    if req.resource_type in _BLOCKED_RESOURCE_TYPES or any(d in req.url for d in _BLOCKED_URL_PARTS):
+        route.abort()
+    else:
+        route.continue_()
+
+
+def _discard(entries) -> None:
+    """Drop cards past the limit: cancel queued decodes, remove files already written."""
+    for _, _, fut in entries:
+        if fut is None or fut.cancel():
+            continue
+        photo_path = fut.result()
+        if photo_path != NO_IMAGE_TOKEN:
+            Path(photo_path).unlink(missing_ok=True)
+
+
+@contextmanager
+def scraper_session(headless: bool = False,
+                    storage_state: str | Path | None = STATE_FILE_DEFAULT) -> Iterator[BrowserContext]:
+    """
+    Launch Chromium once and yield a browser context that can be reused for
+    many persons (pass it as `context=` to scrape_linkedin_images_into_json).
+    Fonts, stylesheets, media and ad/analytics requests are aborted.
+    :param headless: Headless mode.
+    :param storage_state: Session state file preloaded into the context, if it exists.
+    """
+    with sync_playwright() as p:
+        browser = p.chromium.launch(
+            headless=headless,
+            args=["--disable-blink-features=AutomationControlled"]
+        )
+        state = storage_state if (storage_state and Path(storage_state).exists()) else None
+        context = browser.new_context(
+            locale="en-US",
+            user_agent=("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                        "AppleWebKit/537.36 (KHTML, like Gecko) "
+                        "Chrome/120.0.0.0 Safari/537.36"),
+            storage_state=state,
+        )
+        context.route("**/*", _block_non_essential)
+        try:
+            yield context
+        finally:
+            context.close()
+            browser.close()
 
 
 def scrape_linkedin_images_into_json(json_path: str | Path, *,
                                      headless: bool = False,
                                      limit: int = 10,
+                                     context: BrowserContext | None = None,
                                      ) -> int:
     """
     Main function that scrapes the LinkedIn images and links from Google Images.
     :param json_path: Path to a person JSON (with query_name).
     :param headless: Headless mode.
     :param limit: Maximum profiles retrieved
-    :return:
+    :param context: Browser context to reuse (see scraper_session); a new browser is launched if None.
+    :return: Number of photos saved.
     """
+    if context is None:
+        with scraper_session(headless=headless) as ctx:
+            return scrape_linkedin_images_into_json(json_path, limit=limit, context=ctx)
+
     json_path = Path(json_path)
     data = load_person(json_path)
     full_name = (data.get("query_name") or "").strip()
@@ -180,36 +248,29 @@ def scrape_linkedin_images_into_json(json_path: str | Path, *,
     url = GOOGLE_IMG.format(q=urllib.parse.quote_plus(query))
     dest_dir = Path("Persons_photos") / _slugify(str(full_name))
 
-    saved = 0
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=headless,
-            args=["--disable-blink-features=AutomationControlled"]
-        )
-        context = browser.new_context(
-            locale="en-US",
-            user_agent=("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/120.0.0.0 Safari/537.36"),
-        )
-        page = context.new_page()
-
-        try:
-            page.goto(url, wait_until="domcontentloaded", timeout=30_000)
-            # wait for some base64 images to appear
-            page.wait_for_selector('img[src^="data:image/"]', timeout=15_000)
-        except PWTimeout:
-            browser.close()
-            return 0
-
+    page = context.new_page()
+    try:
+        page.goto(url, wait_until="domcontentloaded", timeout=30_000)
+        # wait for some base64 images to appear
+        page.wait_for_selector('img[src^="data:image/"]', timeout=15_000)
         # Collect a bit more than limit, we'll filter/skip dupes later
-        cards = _collect_by_forward_scan_python(page, max_collect=limit * 5)
+        cards = _collect_by_forward_scan(page, max_collect=limit * 5)
+    except PWTimeout:
+        return 0
+    finally:
+        page.close()
 
-        seen_profiles = set()
+    saved = 0
+    # In-memory view of existing candidates: no per-card JSON re-parse
+    have = index_candidates(data)
+    # (profile_url, name, photo_path) upserts, written in one go after the loop
+    records: list[tuple[str, str, str | None]] = []
+    # Cards in page order: (prof, name, future) or (prof, name, None) for known candidates.
+    # Decode + disk writes run on a pool while this loop moves on to the next card
+    entries = []
+    seen_profiles = set()
+    with ThreadPoolExecutor(max_workers=4) as pool:
         for card in cards:
-            if saved >= limit:
-                break
-
             data_url = card.get("data_url") or ""
             prof = card.get("href") or ""
             title = card.get("title") or ""
@@ -221,42 +282,51 @@ def scrape_linkedin_images_into_json(json_path: str | Path, *,
             # Guess name from the Google tile title (text before " - ")
             name_guess = _title_to_name(title)
 
-            # ensure candidate exists + stash name
-            upsert_candidate(json_path, prof, name_guess)
-
-            # If we already have a good photo, skip heavy work
-            if candidate_has_photo(json_path, prof):
+            # Already processed (real photo or NO_IMAGE_TOKEN): skip heavy work, still stash the name
+            known = have.get(prof)
+            if known and (known.get("photo_path") or "").strip():
+                entries.append((prof, name_guess, None))
                 continue
 
-            # Decode the base64 thumbnail
-            parsed = _parse_data_url(data_url)
-            if not parsed:
-                # mark as processed to avoid rework
-                upsert_candidate(json_path, prof, name_guess, photo_path=NO_IMAGE_TOKEN)
-                continue
-
-            ext, raw = parsed
-            handle = _profile_handle(prof)
-            out_path = (dest_dir / handle).with_suffix(ext)
-
-            try:
-                out_path.parent.mkdir(parents=True, exist_ok=True)
-                out_path.write_bytes(raw)
+            out_stem = dest_dir / (card.get("handle") or _slugify(prof))
+            entries.append((prof, name_guess, pool.submit(_process_card, data_url, out_stem)))
 
-                # single call: update name (if provided) + set photo path
-                upsert_candidate(json_path, prof, name_guess, photo_path=str(out_path))
-                print(f"Saved photo for url:'{prof}' and name '{name_guess}' to path: '{out_path}'")
+        # Drain in page order; stop accepting once `limit` photos are saved
+        for i, (prof, name_guess, fut) in enumerate(entries):
+            if saved >= limit:
+                _discard(entries[i:])
+                break
+            if fut is None:
+                records.append((prof, name_guess, None))
+                continue
+            photo_path = fut.result()
+            # single record: update name (if provided) + set photo path (or mark no_image)
+            records.append((prof, name_guess, photo_path))
+            if photo_path != NO_IMAGE_TOKEN:
+                print(f"Saved photo for url:'{prof}' and name '{name_guess}' to path: '{photo_path}'")
                 saved += 1
-            except Exception:
-                upsert_candidate(json_path, prof, name_guess, photo_path=NO_IMAGE_TOKEN)
 
-
-        context.close()
-        browser.close()
+    bulk_upsert_candidates(json_path, records)
 
     return saved
 
 
+def scrape_many(json_paths: Iterable[str | Path], *,
+                headless: bool = False,
+                limit: int = 10,
+                storage_state: str | Path | None = STATE_FILE_DEFAULT,
+                ) -> dict[str, int]:
+    """
+    Run scrape_linkedin_images_into_json for many persons in one browser session.
+    :return: {json_path: photos saved}
+    """
+    counts = {}
+    with scraper_session(headless=headless, storage_state=storage_state) as context:
+        for json_path in json_paths:
+            counts[str(json_path)] = scrape_linkedin_images_into_json(json_path, limit=limit, context=context)
+    return counts
+
+
 # ---------- CLI ----------
 def _cli():
     import argparse
@@ -1,21 +1,77 @@
-import json
+import os
+import base64
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterable, Iterator
 
-NO_IMAGE_TOKEN = "no_image"  # sed to mark profiles without a usable picture
+import numpy as np
+import orjson
 
+NO_IMAGE_TOKEN = "no_image"  # sed to mark profiles without a usable picture
 
 # ========== core io ==========
 
 
 def load_person(path: str | Path) -> Dict[str, Any]:
     """Read a person JSON file and return it as a dict."""
-    return json.loads(Path(path).read_text(encoding="utf-8"))
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
 
 def save_person(path: str | Path, data: Dict[str, Any]):
-    """Write a person dict back to disk."""
-    Path(path).write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    """Write a person dict back to disk (temp file + os.replace, so never half-written)."""
+    path = Path(path)
+    tmp = path.parent / f".{path.name}.{os.getpid()}.{os.urandom(4).hex()}.tmp"
+    # 0o666 lets the process umask apply, like a plain open(path, "w") would
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        try:
+            os.chmod(tmp, path.stat().st_mode & 0o777)  # keep the existing file's mode
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+@contextmanager
+def mutating_person(path: str | Path) -> Iterator[Dict[str, Any]]:
+    """
+    Load a person JSON once, yield the dict for in-place edits and write it
+    back once on exit. Nothing is written if the block raises.
+    """
+    data = load_person(path)
+    yield data
+    save_person(path, data)
+
+
+# ========== embeddings ==========
+
+
+def encode_embedding(emb: np.ndarray) -> str:
+    """Serialize an embedding as base64 float32 bytes (compact JSON string)."""
+    return base64.b64encode(np.asarray(emb, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_embedding(s: str) -> np.ndarray:
+    """Inverse of encode_embedding."""
+    return np.frombuffer(base64.b64decode(s), dtype=np.float32)
+
+
+def set_source_embedding(data: Dict[str, Any], src_path: str, mtime: float, emb: np.ndarray):
+    """Store the source image embedding in the person dict, keyed by file path + mtime."""
+    data["source_embedding"] = {"path": src_path, "mtime": mtime, "emb": encode_embedding(emb)}
+
+
+def get_source_embedding(data: Dict[str, Any], src_path: str, mtime: float) -> Optional[np.ndarray]:
+    """Return the stored source embedding if it was computed for this exact file version."""
+    se = data.get("source_embedding") or {}
+    if se.get("path") != src_path or se.get("mtime") != mtime or not se.get("emb"):
+        return None
+    return decode_embedding(se["emb"])
 
 
 # ========== candidates indexing ==========
@@ -29,6 +85,11 @@ def _find_idx(data, url):
     return -1
 
 
+def index_candidates(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Map stripped profile_url -> candidate dict, for O(1) lookups while mutating."""
+    return {(c.get("profile_url") or "").strip(): c for c in data.get("candidates", [])}
+
+
 def get_candidate(data: Dict[str, Any], profile_url: str) -> Optional[Dict[str, Any]]:
     """Return the candidate dict for this profile_url, or None if missing."""
     idx = _find_idx(data, profile_url)
@@ -70,23 +131,17 @@ def candidate_has_face(person_json: str | Path, profile_url: str) -> bool:
 
 
 
-def upsert_candidate(
-        person_json: str | Path,
+def _upsert_entry(
+        data: Dict[str, Any],
+        index: Dict[str, Dict[str, Any]],
         profile_url: str,
         name: str,
         photo_path: str | Path | None = None,
 ) -> None:
-    """
-    Insert candidate if missing; otherwise update:
-      - name: overwrite only if the new name is non-empty
-      - photo_path: set only if photo_path is provided AND
-                    (no existing photo OR existing == NO_IMAGE_TOKEN)
-    Backward-compatible with old calls (photo_path is optional).
-    """
-    data = load_person(person_json)
-    idx = _find_idx(data, profile_url)
+    """In-memory upsert shared by upsert_candidate and bulk_upsert_candidates."""
+    entry = index.get((profile_url or "").strip())
 
-    if idx == -1:
+    if entry is None:
         entry = {
             "profile_url": profile_url,
             "name": name or "",
@@ -99,8 +154,8 @@ def upsert_candidate(
         if photo_path is not None:
             entry["photo_path"] = str(photo_path)
         data.setdefault("candidates", []).append(entry)
+        index[(profile_url or "").strip()] = entry
     else:
-        entry = data["candidates"][idx]
         if name:  # only overwrite if a non-empty name was provided
             entry["name"] = name
 
@@ -110,7 +165,36 @@ def upsert_candidate(
             if not existing or existing == NO_IMAGE_TOKEN:
                 entry["photo_path"] = str(photo_path)
 
-    save_person(person_json, data)
+
+def upsert_candidate(
+        person_json: str | Path,
+        profile_url: str,
+        name: str,
+        photo_path: str | Path | None = None,
+) -> None:
+    """
+    Insert candidate if missing; otherwise update:
+      - name: overwrite only if the new name is non-empty
+      - photo_path: set only if photo_path is provided AND
+                    (no existing photo OR existing == NO_IMAGE_TOKEN)
+    Backward-compatible with old calls (photo_path is optional).
+    """
+    with mutating_person(person_json) as data:
+        _upsert_entry(data, index_candidates(data), profile_url, name, photo_path)
+
+
+def bulk_upsert_candidates(
+        person_json: str | Path,
+        records: Iterable[tuple[str, str, str | Path | None]],
+) -> None:
+    """
+    Apply many (profile_url, name, photo_path) upserts with a single
+    load + write. Same per-record rules as upsert_candidate, in order.
+    """
+    with mutating_person(person_json) as data:
+        index = index_candidates(data)
+        for profile_url, name, photo_path in records:
+            _upsert_entry(data, index, profile_url, name, photo_path)
 
 
 def set_candidate_photo(person_json: str | Path, profile_url: str, photo_url: str | None, photo_path: str | None):
@@ -151,21 +235,51 @@ def set_candidate_name_eval(person_json: str | Path, profile_url: str,
 # ========== selection ==========
 
 
-def select_best_candidate(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def select_best_candidate(data: Dict[str, Any],
+                          name_scores: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
     """
     Return the candidate with the highest face['sigmoid'].
+    Ties on sigmoid are broken by name_scores (profile_url -> name similarity), if given.
     Returns None if no candidate has a numeric sigmoid.
     """
+    name_scores = name_scores or {}
     best = None
-    best_s = float("-inf")
+    best_key = (float("-inf"), float("-inf"))
 
     for c in data.get("candidates", []):
         s = (c.get("face") or {}).get("sigmoid")
         if s is None:
             continue
 
-        if s > best_s:
-            best_s = s
+        key = (s, name_scores.get(c.get("profile_url"), 0.0))
+        if key > best_key:
+            best_key = key
             best = c
 
     return best
+
+
+def select_best_candidate_by_embedding(data: Dict[str, Any],
+                                       name_scores: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Same pick as select_best_candidate, ranked by cosine similarity of the stored
+    candidate embeddings (face['emb']) against the stored source embedding:
+    rows are stacked into an (N, D) matrix and scored with a single matmul.
+    Falls back to select_best_candidate when any scored candidate (or the
+    source) has no stored embedding, e.g. metrics from older runs.
+    """
+    src = (data.get("source_embedding") or {}).get("emb")
+    scored = [c for c in data.get("candidates", []) if (c.get("face") or {}).get("sigmoid") is not None]
+    if not src or not scored or any(not c["face"].get("emb") for c in scored):
+        return select_best_candidate(data, name_scores)
+
+    emb_src = decode_embedding(src)
+    emb_src = emb_src / max(float(np.linalg.norm(emb_src)), 1e-12)
+    E = np.stack([decode_embedding(c["face"]["emb"]) for c in scored])
+    E /= np.maximum(np.linalg.norm(E, axis=1, keepdims=True), 1e-12)
+    sims = E @ emb_src
+
+    name_scores = name_scores or {}
+    names = np.array([name_scores.get(c.get("profile_url"), 0.0) for c in scored])
+    # lexsort: last key is primary -> highest similarity, then highest name score
+    return scored[int(np.lexsort((names, sims))[-1])]
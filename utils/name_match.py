@@ -1,29 +1,60 @@
 import re
+from functools import lru_cache
 from unidecode import unidecode
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
+# Runs of anything else (whitespace included) collapse to one space in a single pass
+_NORM_RE = re.compile(r"[^a-z0-9'-]+")
 
+
+@lru_cache(maxsize=4096)
 def normalize_name(s: str) -> str:
     """
     Lowercase, keep letters/digits/space/'/-, collapse spaces.
-    Unidecode for accents.
+    Unidecode for accents (only when needed: ASCII names skip it).
+    Memoized: the same names are compared many times.
+    """
+    s = s or ""
+    if not s.isascii():
+        s = unidecode(s)
+    return _NORM_RE.sub(" ", s.lower()).strip()
+
+
+def similarity_normalized(na: str, nb: str, score_cutoff: float = 0) -> float:
+    """
+    Name similarity for names already passed through normalize_name.
+    Scores below score_cutoff come back as 0 (RapidFuzz prunes them early).
     """
-    s = unidecode(s or "").lower()
-    s = re.sub(r"[^a-z0-9\s'-]+", " ", s)
-    return " ".join(s.split())
+    return float(fuzz.token_sort_ratio(na, nb, score_cutoff=score_cutoff))
 
 
 def name_similarity(a: str, b: str) -> float:
     """Compute name similarity between two names."""
-    a, b = normalize_name(a), normalize_name(b)
-    return float(fuzz.token_sort_ratio(a, b))
+    return similarity_normalized(normalize_name(a), normalize_name(b))
+
+
+def name_similarities(query: str, names: list[str]) -> list[float]:
+    """
+    Similarity of one query name against many names, scored in a single
+    RapidFuzz cdist call (C loop, all cores) instead of a Python loop.
+    """
+    if not names:
+        return []
+    scores = process.cdist(
+        [normalize_name(query)],
+        [normalize_name(n) for n in names],
+        scorer=fuzz.token_sort_ratio,
+        workers=-1,
+    )
+    return [float(x) for x in scores[0]]
 
 
 def is_exact_name(a: str, b: str) -> bool:
     """
     Exact equality after normalization.
     """
-    return normalize_name(a) == normalize_name(b)
+    na, nb = normalize_name(a), normalize_name(b)
+    return na == nb
 
 
 def cli():